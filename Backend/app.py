@@ -5,9 +5,10 @@ from flask import Flask
 from flask_cors import CORS
 # Use relative import
 from firebase_admin_init import db
-from routes.scan import bp as scan_bp   # 👈 rename to avoid clash
+from routes.scan import bp as scan_bp, warm_models   # 👈 rename to avoid clash
 from routes.history import history_bp
 from routes.report import report_bp
+from routes.embeddings import embeddings_bp
 
 # ----------------- NEW IMPORTS & CONFIG -----------------
 import cloudinary
@@ -45,6 +46,17 @@ def create_app():
     app.register_blueprint(scan_bp)
     app.register_blueprint(history_bp)
     app.register_blueprint(report_bp)
+    app.register_blueprint(embeddings_bp)
+
+    # Opt-in (WARM_MODELS_ON_START=1): load models now so the first /scan isn't slow.
+    # Under `python app.py` the debug reloader imports this module twice; only the
+    # child that serves requests (WERKZEUG_RUN_MAIN=true) warms up.
+    reloader_parent = __name__ == "__main__" and os.environ.get("WERKZEUG_RUN_MAIN") != "true"
+    if os.getenv("WARM_MODELS_ON_START", "0") == "1" and not reloader_parent:
+        try:
+            warm_models()
+        except Exception as e:
+            print("⚠️ Model warm-up failed (will retry lazily):", e)
 
     return app
 
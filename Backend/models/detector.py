@@ -1,9 +1,13 @@
 # Backend/models/detector.py
+import os
+import threading
 from io import BytesIO
 from PIL import Image, ImageOps
 import numpy as np
 import torch
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
+
+from models.embedding_store import EmbeddingStore, content_hash, file_hash
 
 # --- Model config ---
 MODEL_ID: Optional[str] = "prithivMLmods/deepfake-detector-model-v1"
@@ -11,6 +15,12 @@ INVERT_LOCAL_PROB: bool = False   # ← set True if you discover the labels are
 _PROCESSOR = None
 _MODEL = None
 
+# --- Embedding cache (pooled backbone output = classifier head input) ---
+EMBEDDING_STORE_DIR: Optional[str] = os.getenv("EMBEDDING_STORE_DIR")  # unset → disabled
+_STORE: Optional[EmbeddingStore] = None
+_CAPTURE = threading.local()
+_HOOK_LOCK = threading.Lock()
+
 
 def _lazy_load() -> Tuple[object, torch.nn.Module]:
     """Lazy-load processor/model if not injected. Safe no-op if already set."""
@@ -51,6 +61,17 @@ def set_model_objects(processor, model):
         pass
 
 
+def is_loaded() -> bool:
+    return _PROCESSOR is not None and _MODEL is not None
+
+
+def get_model_objects() -> Tuple[object, torch.nn.Module]:
+    """Return the (processor, model) pair used by detect_image_tta, loading it if needed."""
+    if _PROCESSOR is not None and _MODEL is not None:
+        return _PROCESSOR, _MODEL
+    return _lazy_load()
+
+
 def _get_fake_index(model) -> int:
     """
     Try to map 'fake'/'ai' label to index using id2label. Fallback to index 1.
@@ -68,32 +89,56 @@ def _get_fake_index(model) -> int:
 
 
 @torch.inference_mode()
-def _predict_one(img: Image.Image) -> float:
+def _predict_batch(images: List[Image.Image], processor=None, model=None) -> np.ndarray:
     """
-    Return probability that image is AI/fake (0..1).
+    Return probability that each image is AI/fake (0..1), one forward pass for the batch.
+    Falls back to the module-level processor/model when none are given.
+    """
+    if processor is None or model is None:
+        processor, model = get_model_objects()
+    inputs = processor(images=images, return_tensors="pt")
+    return _fake_probs(model, inputs)
+
+
+@torch.inference_mode()
+def _fake_probs(model, inputs) -> np.ndarray:
+    """
+    Run an already-preprocessed batch through `model` and return p_fake per row.
     """
-    processor, model = (_PROCESSOR, _MODEL) if (_PROCESSOR and _MODEL) else _lazy_load()
-    inputs = processor(images=img, return_tensors="pt")
     logits = model(**{k: v for k, v in inputs.items()}).logits
-    probs = torch.softmax(logits, dim=-1)[0].detach().cpu().numpy()
+    probs = torch.softmax(logits, dim=-1).detach().cpu().numpy()
     fake_idx = _get_fake_index(model)
     if fake_idx < 0 or fake_idx >= probs.shape[-1]:
         fake_idx = min(1, probs.shape[-1] - 1)
-    p = float(probs[fake_idx])
+    p = probs[:, fake_idx].astype(np.float64)
     return 1.0 - p if INVERT_LOCAL_PROB else p
 
 
-def detect_image_tta(path: str):
+def _predict_one(img: Image.Image) -> float:
+    """
+    Return probability that image is AI/fake (0..1).
+    """
+    return float(_predict_batch([img])[0])
+
+
+def load_image(source) -> Image.Image:
+    """
+    Decode once to RGB so the detector, the ensemble and TTA can share it.
+    `source` is a file path or the raw image bytes.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = BytesIO(source)
+    return Image.open(source).convert("RGB")
+
+
+def tta_variants(img: Image.Image) -> List[Image.Image]:
     """
-    Simple, fast TTA:
+    Simple, fast TTA variants:
       - original
       - horizontal mirror
       - 0.9x bicubic resize
       - JPEG re-encode @85
-    Returns: {'p_fake': mean, 'p_fake_std': std, 'n': count}
     """
-    img = Image.open(path).convert("RGB")
-
     variants = [
         img,
         ImageOps.mirror(img),
@@ -108,13 +153,134 @@ def detect_image_tta(path: str):
     img.save(buf, format="JPEG", quality=85)
     buf.seek(0)
     variants.append(Image.open(buf).convert("RGB"))
+    return variants
+
+
+def get_head(model) -> Optional[torch.nn.Linear]:
+    """The linear classifier head, if the model exposes one as `.classifier`."""
+    head = getattr(model, "classifier", None)
+    return head if isinstance(head, torch.nn.Linear) else None
+
+
+def _capture_hook(module, args):
+    buf = getattr(_CAPTURE, "buf", None)
+    if buf is not None:
+        buf.append(args[0].detach().float().cpu().numpy())
+
+
+def _ensure_capture_hook(model) -> bool:
+    """Install (once) a pre-hook on the head that records its input for this thread."""
+    head = get_head(model)
+    if head is None:
+        return False
+    with _HOOK_LOCK:
+        if not getattr(head, "_dfs_capture_hook", False):
+            head.register_forward_pre_hook(_capture_hook)
+            head._dfs_capture_hook = True
+    return True
+
+
+def _predict_batch_with_embeddings(images: List[Image.Image]) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Like _predict_batch, also returning the pooled embeddings (N, D) or None."""
+    processor, model = get_model_objects()
+    if not _ensure_capture_hook(model):
+        return _predict_batch(images, processor, model), None
+    _CAPTURE.buf = []
+    try:
+        scores = _predict_batch(images, processor, model)
+        emb = _CAPTURE.buf[0] if _CAPTURE.buf else None
+    finally:
+        _CAPTURE.buf = None
+    return scores, emb
+
+
+def backbone_version(model) -> str:
+    config = getattr(model, "config", None)
+    name = MODEL_ID or getattr(config, "name_or_path", None) or "custom"
+    return f"{name}@{getattr(config, '_commit_hash', None) or 'local'}"
 
-    scores = [_predict_one(v) for v in variants]
-    return {
+
+def get_embedding_store() -> Optional[EmbeddingStore]:
+    """Store for the current backbone, or None if EMBEDDING_STORE_DIR is unset."""
+    global _STORE
+    if not EMBEDDING_STORE_DIR:
+        return None
+    _, model = get_model_objects()
+    version = backbone_version(model)
+    if _STORE is None or _STORE.backbone != version or _STORE.root != os.path.abspath(EMBEDDING_STORE_DIR):
+        _STORE = EmbeddingStore(EMBEDDING_STORE_DIR, version)
+    return _STORE
+
+
+def detect_image_tta(source, img: Optional[Image.Image] = None, return_embeddings: bool = False,
+                     n_variants: Optional[int] = None):
+    """
+    Run the TTA variants (see tta_variants) through the local model as one batch.
+    `source` is a file path or the raw image bytes; pass `img` to reuse an
+    already-decoded image instead of decoding `source` again.
+    `n_variants` keeps only the first N variants (used to shed work under load).
+    With EMBEDDING_STORE_DIR set, the per-variant embeddings are persisted under
+    the file's content hash so rescore_archive() can skip the backbone later.
+    Returns: {'p_fake': mean, 'p_fake_std': std, 'n': count,
+              'scores': per-variant p_fake (variant 0 = original)[, 'embeddings': (n, D)]}
+    """
+    if img is None:
+        img = load_image(source)
+
+    variants = tta_variants(img)
+    full_set = n_variants is None or n_variants >= len(variants)
+    if not full_set:
+        variants = variants[:max(1, n_variants)]
+    store = get_embedding_store()
+    emb = None
+    if return_embeddings or store is not None:
+        scores, emb = _predict_batch_with_embeddings(variants)
+    else:
+        scores = _predict_batch(variants)
+
+    # Only a full variant set is archived, so rescoring stays comparable
+    if store is not None and emb is not None and full_set:
+        try:
+            h = content_hash(bytes(source)) if isinstance(source, (bytes, bytearray)) else file_hash(source)
+            store.put(h, emb)
+        except Exception as e:
+            print("⚠️ Embedding store write failed:", e)
+
+    out = {
         "p_fake": float(np.mean(scores)),
         "p_fake_std": float(np.std(scores)),
         "n": len(scores),
+        "scores": [float(x) for x in scores],
     }
+    if return_embeddings:
+        out["embeddings"] = emb
+    return out
+
+
+def rescore_archive(weight: Optional[np.ndarray] = None, bias: Optional[np.ndarray] = None,
+                    invert: Optional[bool] = None):
+    """
+    Re-score every stored image with a linear head, without running the backbone.
+    Defaults to the loaded model's head and INVERT_LOCAL_PROB.
+    Returns {content_hash: {'p_fake', 'p_fake_std', 'n'}}.
+    """
+    store = get_embedding_store()
+    if store is None:
+        raise RuntimeError("Embedding store disabled: set EMBEDDING_STORE_DIR.")
+    _, model = get_model_objects()
+    if weight is None:
+        head = get_head(model)
+        if head is None:
+            raise RuntimeError("Model has no linear `.classifier` head; pass weight/bias.")
+        weight = head.weight.detach().float().cpu().numpy()
+        bias = head.bias.detach().float().cpu().numpy() if head.bias is not None else None
+    return store.rescore(
+        weight, bias, _get_fake_index(model),
+        invert=INVERT_LOCAL_PROB if invert is None else bool(invert),
+    )
 
 
-__all__ = ["detect_image_tta", "set_model_objects"]
+__all__ = [
+    "detect_image_tta", "load_image", "tta_variants", "set_model_objects",
+    "get_embedding_store", "rescore_archive",
+]
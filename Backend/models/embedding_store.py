@@ -0,0 +1,206 @@
+# Backend/models/embedding_store.py
+"""
+Memory-mapped store of pooled backbone embeddings (the classifier head's input),
+one row per image x TTA variant, keyed by content hash and backbone version.
+
+Layout under <root>/<backbone version>/:
+  meta.json   {"backbone": ..., "dim": D}
+  emb.f32     raw float32 rows (append-only), mapped as an (N, D) array
+  keys.tsv    one "<sha256>\t<variant>" line per row (append-only)
+
+With the embeddings stored, flipping INVERT_LOCAL_PROB or swapping/fine-tuning
+only the classifier head is one matrix multiply over the archive (rescore()),
+instead of pushing every image through the transformer again.
+
+Benchmark against full re-inference:
+  python -m models.embedding_store bench <image_dir> [--store DIR]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return content_hash(f.read())
+
+
+class EmbeddingStore:
+    def __init__(self, root: str, backbone: str, dim: Optional[int] = None):
+        self.backbone = backbone
+        self.root = os.path.abspath(root)
+        self.dir = os.path.join(self.root, re.sub(r"[^A-Za-z0-9._-]+", "_", backbone))
+        self._emb_path = os.path.join(self.dir, "emb.f32")
+        self._keys_path = os.path.join(self.dir, "keys.tsv")
+        self._meta_path = os.path.join(self.dir, "meta.json")
+        self._lock = threading.Lock()
+        self.dim = dim
+        self._keys: List[tuple] = []
+        self._rows_by_hash: Dict[str, List[int]] = {}
+        os.makedirs(self.dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                self.dim = int(json.load(f)["dim"])
+        if self.dim is None:
+            return
+        raw = ""
+        if os.path.exists(self._keys_path):
+            with open(self._keys_path) as f:
+                raw = f.read()
+        keys = []
+        for line in raw.split("\n"):
+            parts = line.split("\t")
+            if len(parts) != 2 or not parts[1].isdigit():
+                break  # torn or garbled tail
+            keys.append((parts[0], int(parts[1])))
+
+        # A crash between the two appends (or mid-row) leaves one side longer.
+        # Cut both files back to the rows they agree on, so the next put()
+        # appends at the row number it records.
+        n_vec = os.path.getsize(self._emb_path) // (4 * self.dim) if os.path.exists(self._emb_path) else 0
+        n = min(len(keys), n_vec)
+        if os.path.exists(self._emb_path) and os.path.getsize(self._emb_path) != n * 4 * self.dim:
+            os.truncate(self._emb_path, n * 4 * self.dim)
+        clean = "".join(f"{h}\t{v}\n" for h, v in keys[:n])
+        if raw != clean:
+            with open(self._keys_path, "w") as f:
+                f.write(clean)
+        self._keys = keys[:n]
+        for row, (h, _) in enumerate(self._keys):
+            self._rows_by_hash.setdefault(h, []).append(row)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, h: str) -> bool:
+        return h in self._rows_by_hash
+
+    def put(self, h: str, embeddings: np.ndarray) -> bool:
+        """
+        Append all variant rows for content hash `h`. No-op if already stored.
+        Returns True if rows were written.
+        """
+        emb = np.ascontiguousarray(np.asarray(embeddings, dtype=np.float32))
+        if emb.ndim == 1:
+            emb = emb[None, :]
+        with self._lock:
+            if h in self._rows_by_hash:
+                return False
+            if self.dim is None:
+                self.dim = int(emb.shape[1])
+                with open(self._meta_path, "w") as f:
+                    json.dump({"backbone": self.backbone, "dim": self.dim}, f)
+            if emb.shape[1] != self.dim:
+                raise ValueError(f"embedding dim {emb.shape[1]} != store dim {self.dim}")
+
+            start = len(self._keys)
+            with open(self._emb_path, "ab") as f:
+                f.write(emb.tobytes())
+            with open(self._keys_path, "a") as f:
+                f.writelines(f"{h}\t{v}\n" for v in range(emb.shape[0]))
+            new_keys = [(h, v) for v in range(emb.shape[0])]
+            self._keys.extend(new_keys)
+            self._rows_by_hash[h] = list(range(start, start + len(new_keys)))
+            return True
+
+    def matrix(self) -> np.ndarray:
+        """Read-only (N, D) memory map over all stored rows."""
+        n = len(self._keys)
+        if n == 0 or self.dim is None:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self._emb_path, dtype=np.float32, mode="r", shape=(n, self.dim))
+
+    def get(self, h: str) -> Optional[np.ndarray]:
+        rows = self._rows_by_hash.get(h)
+        return None if rows is None else np.asarray(self.matrix()[rows])
+
+    def hashes(self) -> List[str]:
+        return list(self._rows_by_hash.keys())
+
+    def rescore(self, weight: np.ndarray, bias: Optional[np.ndarray], fake_idx: int,
+                invert: bool = False) -> Dict[str, dict]:
+        """
+        Apply a linear head (weight: (C, D), bias: (C,)) to every stored row in
+        one matmul and aggregate per image like detect_image_tta.
+        Returns {hash: {'p_fake', 'p_fake_std', 'n'}}.
+        """
+        with self._lock:
+            keys = list(self._keys)
+            by_hash = {h: list(rows) for h, rows in self._rows_by_hash.items()}
+        if not keys:
+            return {}
+        emb = np.memmap(self._emb_path, dtype=np.float32, mode="r", shape=(len(keys), self.dim))
+
+        logits = emb @ np.asarray(weight, dtype=np.float32).T
+        if bias is not None:
+            logits += np.asarray(bias, dtype=np.float32)
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
+        if fake_idx < 0 or fake_idx >= probs.shape[1]:
+            fake_idx = min(1, probs.shape[1] - 1)
+        p = probs[:, fake_idx].astype(np.float64)
+        if invert:
+            p = 1.0 - p
+
+        return {
+            h: {"p_fake": float(p[rows].mean()), "p_fake_std": float(p[rows].std()), "n": len(rows)}
+            for h, rows in by_hash.items()
+        }
+
+
+def _bench(image_dir: str, store_dir: Optional[str]):
+    import tempfile
+    from models import detector
+
+    paths = sorted(
+        os.path.join(image_dir, n) for n in os.listdir(image_dir)
+        if n.rsplit(".", 1)[-1].lower() in ("jpg", "jpeg", "png", "webp", "bmp")
+    )
+    if not paths:
+        print("⚠️ no images found in", image_dir)
+        return
+
+    detector.EMBEDDING_STORE_DIR = store_dir or tempfile.mkdtemp(prefix="emb_")
+    detector.get_model_objects()  # exclude model load from the timings
+
+    t0 = time.perf_counter()
+    full = {file_hash(p): detector.detect_image_tta(p) for p in paths}
+    t_full = time.perf_counter() - t0
+
+    store = detector.get_embedding_store()
+    t0 = time.perf_counter()
+    head = detector.rescore_archive()
+    t_head = time.perf_counter() - t0
+
+    max_diff = max(abs(full[h]["p_fake"] - head[h]["p_fake"]) for h in full if h in head)
+    print(f"images: {len(paths)}  rows: {len(store)}  dim: {store.dim}")
+    print(f"full re-inference : {t_full * 1000:9.1f} ms")
+    print(f"head-only rescore : {t_head * 1000:9.1f} ms  ({t_full / max(t_head, 1e-9):.0f}x)")
+    print(f"max |Δp_fake|      : {max_diff:.2e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embedding store utilities.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("bench", help="Compare full re-inference with head-only re-scoring")
+    b.add_argument("image_dir")
+    b.add_argument("--store", default=None, help="Store directory (default: temp dir)")
+    args = parser.parse_args()
+    if args.cmd == "bench":
+        _bench(args.image_dir, args.store)
@@ -0,0 +1,166 @@
+# Backend/models/registry.py
+"""
+Local model registry for the second-opinion ensemble.
+
+Replaces the remote HF Inference API call: every registered checkpoint runs
+in-process on the image that scan() already decoded. Preprocessing is shared
+between models whose image processors are configured identically, and each
+model sees all of its images in a single batched forward pass.
+
+Per-model latency (last call) and memory cost (parameters + buffers) are
+tracked so they can be surfaced in scan signals and /models/ensemble.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import torch
+from PIL import Image
+
+from models import detector
+
+# Comma-separated checkpoint ids. Empty by default, in which case scan() keeps
+# using the remote HF API as its second opinion (see USE_HF_API in routes/scan.py).
+# The primary MODEL_ID is not a default member: its original-image score is
+# already row 0 of the TTA batch, and listing it reuses that score instead of
+# a new forward pass.
+ENSEMBLE_MODEL_IDS: List[str] = [
+    m.strip()
+    for m in os.getenv("ENSEMBLE_MODEL_IDS", "").split(",")
+    if m.strip()
+]
+
+_ENTRIES: Dict[str, Dict[str, Any]] = {}
+_FAILED: Dict[str, str] = {}   # model_id -> load error; not retried per request
+_LOCK = threading.Lock()
+
+
+def _model_bytes(model) -> int:
+    """Approximate resident size of a model: parameters + buffers."""
+    try:
+        tensors = list(model.parameters()) + list(model.buffers())
+        return int(sum(t.numel() * t.element_size() for t in tensors))
+    except Exception:
+        return 0
+
+
+def _processor_key(processor) -> str:
+    """Models whose processors serialize identically can share pixel_values."""
+    try:
+        return json.dumps(processor.to_dict(), sort_keys=True, default=str)
+    except Exception:
+        return f"id:{id(processor)}"
+
+
+def register_model(model_id: str, processor=None, model=None) -> Dict[str, Any]:
+    """
+    Add a checkpoint to the ensemble. Pass processor/model to inject objects
+    loaded elsewhere; otherwise they are loaded from `model_id`.
+    Returns the registry entry (without the model objects).
+    """
+    with _LOCK:
+        if model_id in _ENTRIES:
+            return _public(_ENTRIES[model_id])
+
+        t0 = time.perf_counter()
+        shared = False
+        if processor is None or model is None:
+            if model_id == detector.MODEL_ID:
+                processor, model = detector.get_model_objects()
+                shared = True
+            else:
+                from transformers import AutoImageProcessor, AutoModelForImageClassification
+                processor = AutoImageProcessor.from_pretrained(model_id)
+                model = AutoModelForImageClassification.from_pretrained(model_id)
+        try:
+            model.eval()
+        except Exception:
+            pass
+
+        entry = {
+            "model_id": model_id,
+            "processor": processor,
+            "model": model,
+            "processor_key": _processor_key(processor),
+            "memory_bytes": 0 if shared else _model_bytes(model),
+            "shared_with_primary": shared,
+            "load_ms": (time.perf_counter() - t0) * 1000.0,
+            "last_latency_ms": None,
+        }
+        _ENTRIES[model_id] = entry
+        _FAILED.pop(model_id, None)
+        print(f"🧩 ensemble: registered {model_id} "
+              f"(+{entry['memory_bytes'] / 2**20:.1f} MiB, load {entry['load_ms']:.0f} ms)")
+        return _public(entry)
+
+
+def _ensure_loaded() -> List[Dict[str, Any]]:
+    for model_id in ENSEMBLE_MODEL_IDS:
+        if model_id not in _ENTRIES and model_id not in _FAILED:
+            try:
+                register_model(model_id)
+            except Exception as e:
+                _FAILED[model_id] = str(e)
+                print(f"⚠️ ensemble: could not load {model_id} (disabled): {e}")
+    return [_ENTRIES[m] for m in ENSEMBLE_MODEL_IDS if m in _ENTRIES]
+
+
+def is_loaded() -> bool:
+    """True once every configured checkpoint has been loaded (or has failed)."""
+    return all(m in _ENTRIES or m in _FAILED for m in ENSEMBLE_MODEL_IDS)
+
+
+def _public(entry: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in entry.items() if k not in ("processor", "model", "processor_key")}
+
+
+def ensemble_predict(images: List[Image.Image], primary_p_fake: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Score `images` with every registered model.
+    `primary_p_fake` is the primary model's score for the same images (TTA
+    variant 0); an entry sharing the primary's objects reuses it instead of
+    running another forward pass.
+    Returns one vote per model: {'model_id', 'p_fake' (mean over images), 'latency_ms'}.
+    Models that fail are skipped rather than failing the scan.
+    """
+    entries = _ensure_loaded()
+    if not entries or not images:
+        return []
+
+    # Preprocess once per distinct processor config
+    pixel_cache: Dict[str, Any] = {}
+    votes = []
+    for entry in entries:
+        if entry["shared_with_primary"] and primary_p_fake is not None:
+            votes.append({"model_id": entry["model_id"], "p_fake": float(primary_p_fake), "latency_ms": 0.0})
+            continue
+        try:
+            t0 = time.perf_counter()
+            inputs = pixel_cache.get(entry["processor_key"])
+            if inputs is None:
+                inputs = entry["processor"](images=images, return_tensors="pt")
+                pixel_cache[entry["processor_key"]] = inputs
+            probs = detector._fake_probs(entry["model"], inputs)
+            latency_ms = (time.perf_counter() - t0) * 1000.0
+            entry["last_latency_ms"] = latency_ms
+            votes.append({
+                "model_id": entry["model_id"],
+                "p_fake": float(probs.mean()),
+                "latency_ms": latency_ms,
+            })
+        except Exception as e:
+            print(f"❌ ensemble: {entry['model_id']} failed:", e)
+    return votes
+
+
+def model_report() -> List[Dict[str, Any]]:
+    """Per-model load time, memory cost and last observed latency (or load error)."""
+    report = [_public(e) for e in _ensure_loaded()]
+    report += [{"model_id": m, "error": err} for m, err in _FAILED.items()]
+    return report
+
+
+__all__ = ["ENSEMBLE_MODEL_IDS", "register_model", "ensemble_predict", "model_report", "is_loaded"]
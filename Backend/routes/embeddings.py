@@ -0,0 +1,53 @@
+# Backend/routes/embeddings.py
+from flask import Blueprint, request, jsonify
+import time
+import traceback
+
+import numpy as np
+
+from models.detector import get_embedding_store, rescore_archive
+
+embeddings_bp = Blueprint("embeddings", __name__)
+
+
+@embeddings_bp.route("/embeddings/rescore", methods=["POST"])
+def rescore():
+    """
+    Re-score the stored embedding archive with a linear head (one matmul).
+    JSON body (all optional):
+      invert: bool          — override INVERT_LOCAL_PROB
+      weight: [[...], ...]  — (num_labels, dim) head weights; default = loaded model's head
+      bias:   [...]         — (num_labels,)
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        store = get_embedding_store()
+        if store is None:
+            return jsonify({"error": "Embedding store disabled (set EMBEDDING_STORE_DIR)"}), 400
+
+        weight = data.get("weight")
+        bias = data.get("bias")
+        if weight is not None:
+            weight = np.asarray(weight, dtype=np.float32)
+            if weight.ndim != 2 or weight.shape[1] != store.dim:
+                return jsonify({"error": f"weight must be (num_labels, {store.dim})"}), 400
+            if bias is not None:
+                bias = np.asarray(bias, dtype=np.float32)
+                if bias.shape != (weight.shape[0],):
+                    return jsonify({"error": f"bias must be ({weight.shape[0]},)"}), 400
+
+        t0 = time.perf_counter()
+        scores = rescore_archive(weight=weight, bias=bias, invert=data.get("invert"))
+        elapsed_ms = (time.perf_counter() - t0) * 1000.0
+
+        return jsonify({
+            "backbone": store.backbone,
+            "images": len(scores),
+            "rows": len(store),
+            "elapsed_ms": elapsed_ms,
+            "scores": scores,
+        }), 200
+
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
@@ -2,6 +2,7 @@
 from flask import Blueprint, request, jsonify
 from firebase_admin_init import db
 from google.cloud import firestore as gcfs  # Query.DESCENDING, SERVER_TIMESTAMP
+from utils.scan_stats import get_stats
 import datetime
 import traceback
 
@@ -62,3 +63,28 @@ def get_user_history():
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
+
+
+@history_bp.route('/history/stats', methods=['POST'])
+def get_user_stats():
+    """Totals, fake/real counts and confidence histogram from one aggregate doc."""
+    try:
+        data = request.get_json(silent=True) or {}
+        user_id = data.get("userId")
+        if not user_id:
+            return jsonify({"error": "Missing userId"}), 400
+
+        stats = get_stats(db, user_id)
+        dt = stats.get("lastScanAt")
+        if hasattr(dt, "to_datetime"):
+            dt = dt.to_datetime()
+        stats["lastScanAt"] = (dt.strftime("%Y-%m-%d %H:%M:%S")
+                               if isinstance(dt, datetime.datetime) else "")
+        total = stats["total"]
+        stats["fakeRatio"] = (stats["fake"] / total) if total else 0.0
+        stats["realRatio"] = (stats["real"] / total) if total else 0.0
+        return jsonify(stats), 200
+
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
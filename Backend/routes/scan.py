@@ -1,21 +1,38 @@
 # Backend/routes/scan.py
 from flask import Blueprint, request, jsonify
-import os, tempfile, time
+import os, time
+from urllib.parse import urlparse
 from werkzeug.utils import secure_filename
 
-from models.detector import detect_image_tta
+from models.detector import detect_image_tta, load_image, get_model_objects
+from models.detector import is_loaded as detector_loaded
+from models.registry import ensemble_predict, model_report
+from models.registry import is_loaded as ensemble_loaded
 from utils.image_signals import ela_score, exif_hints, laplacian_var
+from utils.admission import (AdmissionController, LEVEL_NAMES, TTA_VARIANTS_AT,
+                             ELA_MAX_SIDE_AT, SECOND_OPINION_AT)
 from utils.hf_api import call_hf_api
+from utils.scan_stats import record_scan
+from utils.url_fetch import FetchError, SingleFlight, UrlResultCache, fetch_image
 from firebase_admin_init import db
-from google.cloud import firestore as gcfs  # <-- needed for SERVER_TIMESTAMP
 
 bp = Blueprint("scan", __name__, url_prefix="/")
 
 ALLOWED_EXT = {"jpg", "jpeg", "png", "webp", "bmp"}
 
+# Load-aware admission: degrade step by step, shed past the hard limit
+ADMISSION = AdmissionController()
+
+# /scan/url: results per URL + ETag/Last-Modified, one fetch per URL at a time
+URL_CACHE   = UrlResultCache()
+URL_FLIGHTS = SingleFlight()
+
 # --- Behavior toggles ---
 NO_UNCERTAIN   = True   # 👈 Always return Fake/Real (never "uncertain")
-USE_HF_API     = True   # Use Hugging Face second opinion
+# Second opinion: the local ensemble (ENSEMBLE_MODEL_IDS) when it produces
+# votes; otherwise the remote HF API, as before the ensemble existed.
+USE_ENSEMBLE   = True   # Local second-opinion ensemble (models/registry.py)
+USE_HF_API     = True   # Remote HF fallback when no ensemble model voted
 SAVE_HISTORY   = True
 
 # --- Thresholds (tune later) ---
@@ -53,6 +70,168 @@ def _ela_norm(ela_value: float | None) -> float:
     return _clip((ela_value - 4.0) / 16.0, 0.0, 1.0)
 
 
+def warm_models() -> None:
+    """Load the detector and ensemble up front so no scan pays for it."""
+    get_model_objects()
+    if USE_ENSEMBLE:
+        model_report()
+
+
+def _models_warm() -> bool:
+    return detector_loaded() and (not USE_ENSEMBLE or ensemble_loaded())
+
+
+def _busy_response():
+    resp = jsonify({"error": "Server busy, retry later"})
+    resp.headers["Retry-After"] = str(ADMISSION.retry_after())
+    return resp, 503
+
+
+class InvalidImage(ValueError):
+    """The bytes could not be decoded as an image (a client error, not a 500)."""
+
+
+def _analyze(data: bytes, level: int) -> dict:
+    """Run the full scan pipeline on in-memory image bytes at a degradation level."""
+    # 1) Local model (with TTA) — decode once, share with the ensemble
+    try:
+        img = load_image(data)
+    except Exception as e:
+        raise InvalidImage(f"Could not decode image: {e}")
+    tta    = detect_image_tta(data, img=img, n_variants=TTA_VARIANTS_AT[level])
+    p_fake = float(tta["p_fake"])
+    p_std  = float(tta["p_fake_std"])
+
+    # 2) Heuristics
+    ela  = ela_score(data, max_side=ELA_MAX_SIDE_AT[level])
+    exif = exif_hints(data)
+    lapv = laplacian_var(data)
+
+    ELA_HARD = (ela is not None) and (ela >= HARD_ELA_HIGH)
+    ELA_HIGH = (ela is not None) and (ela >= SOFT_ELA_HIGH)
+    ELA_LOW  = (ela is not None) and (ela <= SOFT_ELA_LOW)
+
+    # 3) Second opinion: local ensemble, else (optionally) the remote HF API
+    #    (skipped under heavy load)
+    second_opinion = SECOND_OPINION_AT[level]
+    model_votes = (ensemble_predict([img], primary_p_fake=tta["scores"][0])
+                   if (USE_ENSEMBLE and second_opinion) else [])
+    if model_votes:
+        api_p_fake = sum(v["p_fake"] for v in model_votes) / len(model_votes)
+    else:
+        api_p_fake = call_hf_api(data, timeout=6.0) if (USE_HF_API and second_opinion) else None
+
+    # 4) Voting
+    vote_ai, vote_real = 0, 0
+    reasons = []
+
+    # strong local
+    if p_fake >= CONF_STRONG:
+        vote_ai += 1; reasons.append("local>=0.80")
+    if p_fake <= LOW_STRONG:
+        vote_real += 1; reasons.append("local<=0.20")
+
+    # heuristics
+    if ELA_HARD:
+        vote_ai += 2; reasons.append("ELA>=15(hard)")
+    else:
+        if ELA_HIGH:
+            vote_ai += 1; reasons.append("ELA>=10(soft)")
+        elif ELA_LOW:
+            vote_real += 1; reasons.append("ELA<=4(soft_low)")
+
+    # second opinion: one vote per ensemble model (or the single api score)
+    opinions = [(v["model_id"], v["p_fake"]) for v in model_votes] or (
+        [("api", api_p_fake)] if api_p_fake is not None else []
+    )
+    for name, p in opinions:
+        if p >= 0.80:
+            vote_ai += 1; reasons.append(f"{name}>=0.80")
+        elif p <= 0.20:
+            vote_real += 1; reasons.append(f"{name}<=0.20")
+
+    # 5) Primary decision via votes
+    if vote_ai >= 2 and vote_ai > vote_real:
+        decision = "fake"
+        decision_conf = max(p_fake, 0.80)  # show at least strong if votes win
+        reasons.append("votes→fake")
+    elif vote_real >= 2 and vote_real > vote_ai:
+        decision = "real"
+        decision_conf = max(1.0 - p_fake, 0.80)
+        reasons.append("votes→real")
+    else:
+        # 6) Composite fallback (no UNCERTAIN)
+        # Normalize ELA and compose weighted score
+        ela_term = _ela_norm(ela)
+        api_term = api_p_fake if api_p_fake is not None else 0.5
+        final_score = (0.60 * p_fake) + (0.25 * ela_term) + (0.15 * api_term)
+        reasons.append(f"composite={final_score:.3f}(0.60*local+0.25*ela+0.15*api)")
+
+        if final_score >= 0.50:
+            decision = "fake"
+            decision_conf = final_score
+        else:
+            decision = "real"
+            decision_conf = 1.0 - final_score
+
+    # Ensure confidence is within [0,1]
+    decision_conf = float(_clip(decision_conf, 0.0, 1.0))
+
+    payload = {
+        "label": "fake" if decision == "fake" else "real",
+        "decision": decision,
+        "confidence": decision_conf,         # confidence for the chosen side
+        "is_confident": decision_conf >= CONF_STRONG,
+        "threshold": CONF_STRONG,
+        "signals": {
+            "local_p_fake": p_fake,
+            "tta_std": p_std,
+            "ela": float(ela) if ela is not None else None,
+            "ela_norm": _ela_norm(ela) if ela is not None else None,
+            "laplacian_var": float(lapv) if lapv is not None else None,
+            "exif_has": bool(exif.get("has_exif")),
+            "exif_software": exif.get("software"),
+            "api_p_fake": float(api_p_fake) if api_p_fake is not None else None,
+            "model_votes": model_votes,
+            "votes_ai": vote_ai,
+            "votes_real": vote_real,
+            "reasons": reasons,
+            "degradation_level": level,
+            "degradation": LEVEL_NAMES[level],
+            "tta_n": int(tta["n"]),
+        }
+    }
+
+    # Debug prints
+    print("\n==== DEBUG RAW ====")
+    print("p_fake:", p_fake, "std:", p_std)
+    print("ELA:", ela, "ELA_HARD:", ELA_HARD, "ELA_HIGH:", ELA_HIGH, "ELA_LOW:", ELA_LOW)
+    print("lapv:", lapv, "exif:", exif)
+    print("api_p_fake:", api_p_fake, "model_votes:", model_votes)
+    print("votes → AI:", vote_ai, "REAL:", vote_real, "| degradation:", LEVEL_NAMES[level])
+    print("→ decision:", decision, "| conf:", decision_conf, "| reasons:", reasons)
+    print("===================\n")
+
+    return payload
+
+
+def _save_history(user_id, filename: str, payload: dict) -> None:
+    if not (SAVE_HISTORY and user_id):
+        return
+    try:
+        # Write where /history expects (users/{uid}/scans, server timestamp)
+        # and bump users/{uid}/stats/scans in the same batch
+        record_scan(db, user_id, {
+            "filename": filename,
+            "decision": payload["decision"],
+            "confidence": payload["confidence"],
+            "threshold": payload["threshold"],
+            "signals": payload["signals"],
+        })
+    except Exception as e:
+        print("⚠️ History write failed:", e)
+
+
 @bp.route("/scan", methods=["POST"])
 def scan():
     if "file" not in request.files:
@@ -65,139 +244,112 @@ def scan():
 
     user_id = request.form.get("userId") or request.args.get("userId")
 
-    # Save to a temp file
+    ticket = ADMISSION.try_acquire()
+    if ticket is None:
+        return _busy_response()
+
     filename = secure_filename(file.filename)
-    tmp_dir = tempfile.mkdtemp(prefix="scan_")
-    tmp_path = os.path.join(tmp_dir, filename)
-    file.save(tmp_path)
+    warm = _models_warm()  # a lazy model load is not a load signal
+    try:
+        payload = _analyze(file.read(), ticket.level)
+        _save_history(user_id, filename, payload)
+        return jsonify(payload), 200
+
+    except InvalidImage as e:
+        return jsonify({"error": str(e)}), 422
+    except Exception as e:
+        import traceback; traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+    finally:
+        ADMISSION.release(ticket, record=warm)
+
+
+class _Overloaded(Exception):
+    pass
+
 
+def _url_filename(url: str) -> str:
+    return secure_filename(os.path.basename(urlparse(url).path)) or "url_image"
+
+
+def _scan_url_once(url: str):
+    """
+    Fetch (or revalidate) `url` and scan it. Returns (payload, cache_status)
+    where cache_status is "hit", "revalidated" or "miss".
+    The admission ticket covers the download too, so overload sheds before
+    any bytes are fetched; only full scans feed the latency window.
+    """
+    ticket = ADMISSION.try_acquire()
+    if ticket is None:
+        raise _Overloaded()
+    record = False
     try:
-        # 1) Local model (with TTA)
-        tta    = detect_image_tta(tmp_path)
-        p_fake = float(tta["p_fake"])
-        p_std  = float(tta["p_fake_std"])
-
-        # 2) Heuristics
-        ela  = ela_score(tmp_path)
-        exif = exif_hints(tmp_path)
-        lapv = laplacian_var(tmp_path)
-
-        ELA_HARD = (ela is not None) and (ela >= HARD_ELA_HIGH)
-        ELA_HIGH = (ela is not None) and (ela >= SOFT_ELA_HIGH)
-        ELA_LOW  = (ela is not None) and (ela <= SOFT_ELA_LOW)
-
-        # 3) HF API second opinion
-        api_p_fake = call_hf_api(tmp_path, timeout=6.0) if USE_HF_API else None
-
-        # 4) Voting
-        vote_ai, vote_real = 0, 0
-        reasons = []
-
-        # strong local
-        if p_fake >= CONF_STRONG:
-            vote_ai += 1; reasons.append("local>=0.80")
-        if p_fake <= LOW_STRONG:
-            vote_real += 1; reasons.append("local<=0.20")
-
-        # heuristics
-        if ELA_HARD:
-            vote_ai += 2; reasons.append("ELA>=15(hard)")
-        else:
-            if ELA_HIGH:
-                vote_ai += 1; reasons.append("ELA>=10(soft)")
-            elif ELA_LOW:
-                vote_real += 1; reasons.append("ELA<=4(soft_low)")
-
-        # api
-        if api_p_fake is not None:
-            if api_p_fake >= 0.80:
-                vote_ai += 1; reasons.append("api>=0.80")
-            elif api_p_fake <= 0.20:
-                vote_real += 1; reasons.append("api<=0.20")
-
-        # 5) Primary decision via votes
-        if vote_ai >= 2 and vote_ai > vote_real:
-            decision = "fake"
-            decision_conf = max(p_fake, 0.80)  # show at least strong if votes win
-            reasons.append("votes→fake")
-        elif vote_real >= 2 and vote_real > vote_ai:
-            decision = "real"
-            decision_conf = max(1.0 - p_fake, 0.80)
-            reasons.append("votes→real")
-        else:
-            # 6) Composite fallback (no UNCERTAIN)
-            # Normalize ELA and compose weighted score
-            ela_term = _ela_norm(ela)
-            api_term = api_p_fake if api_p_fake is not None else 0.5
-            final_score = (0.60 * p_fake) + (0.25 * ela_term) + (0.15 * api_term)
-            reasons.append(f"composite={final_score:.3f}(0.60*local+0.25*ela+0.15*api)")
-
-            if final_score >= 0.50:
-                decision = "fake"
-                decision_conf = final_score
-            else:
-                decision = "real"
-                decision_conf = 1.0 - final_score
-
-        # Ensure confidence is within [0,1]
-        decision_conf = float(_clip(decision_conf, 0.0, 1.0))
-
-        payload = {
-            "label": "fake" if decision == "fake" else "real",
-            "decision": decision,
-            "confidence": decision_conf,         # confidence for the chosen side
-            "is_confident": decision_conf >= CONF_STRONG,
-            "threshold": CONF_STRONG,
-            "signals": {
-                "local_p_fake": p_fake,
-                "tta_std": p_std,
-                "ela": float(ela) if ela is not None else None,
-                "ela_norm": _ela_norm(ela) if ela is not None else None,
-                "laplacian_var": float(lapv) if lapv is not None else None,
-                "exif_has": bool(exif.get("has_exif")),
-                "exif_software": exif.get("software"),
-                "api_p_fake": float(api_p_fake) if api_p_fake is not None else None,
-                "votes_ai": vote_ai,
-                "votes_real": vote_real,
-                "reasons": reasons,
-            }
-        }
+        cached = URL_CACHE.get(url)
+        fetched = fetch_image(url,
+                              etag=cached["etag"] if cached else None,
+                              last_modified=cached["last_modified"] if cached else None)
+        if fetched.not_modified and cached:
+            return cached["result"], "revalidated"
+
+        hit = URL_CACHE.lookup(url, fetched.etag, fetched.last_modified)
+        if hit is not None:
+            return hit, "hit"
+        if fetched.data is None:
+            raise FetchError("Upstream returned 304 for an uncached URL", 502)
+
+        warm = _models_warm()
+        payload = _analyze(fetched.data, ticket.level)
+        record = warm
+    finally:
+        ADMISSION.release(ticket, record=record)
 
-        # --- SAVE TO HISTORY ---
-        if SAVE_HISTORY and user_id:
-            try:
-                # Write where /history expects: users/{uid}/scans with server timestamp
-                (db.collection("users")
-                   .document(user_id)
-                   .collection("scans")
-                   .add({
-                        "filename": filename,
-                        "decision": payload["decision"],
-                        "confidence": payload["confidence"],
-                        "threshold": payload["threshold"],
-                        "signals": payload["signals"],
-                        "timestamp": gcfs.SERVER_TIMESTAMP,  # 🔑 enables order_by in history route
-                   }))
-            except Exception as e:
-                print("⚠️ History write failed:", e)
-
-        # Debug prints
-        print("\n==== DEBUG RAW ====")
-        print("p_fake:", p_fake, "std:", p_std)
-        print("ELA:", ela, "ELA_HARD:", ELA_HARD, "ELA_HIGH:", ELA_HIGH, "ELA_LOW:", ELA_LOW)
-        print("lapv:", lapv, "exif:", exif)
-        print("api_p_fake:", api_p_fake)
-        print("votes → AI:", vote_ai, "REAL:", vote_real)
-        print("→ decision:", decision, "| conf:", decision_conf, "| reasons:", reasons)
-        print("===================\n")
+    # Only cache full-quality results
+    if ticket.level == 0:
+        URL_CACHE.put(url, fetched.etag, fetched.last_modified, payload)
+    return payload, "miss"
 
-        return jsonify(payload), 200
 
+@bp.route("/scan/url", methods=["POST"])
+def scan_url():
+    """
+    Scan an image that is already on the web: JSON {"url": ..., "userId": ...}.
+    The image is fetched server-side into memory; see utils/url_fetch.py.
+    """
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    url = data.get("url")
+    if url is not None and not isinstance(url, str):
+        return jsonify({"error": "url must be a string"}), 400
+    url = (url or "").strip()
+    if not url:
+        return jsonify({"error": "Missing url"}), 400
+    user_id = data.get("userId") or request.args.get("userId")
+    if not isinstance(user_id, (str, type(None))):
+        return jsonify({"error": "userId must be a string"}), 400
+
+    try:
+        (payload, cache_status), shared = URL_FLIGHTS.do(url, lambda: _scan_url_once(url))
+        _save_history(user_id, _url_filename(url), payload)
+        return jsonify({**payload, "url": url, "cache": "coalesced" if shared else cache_status}), 200
+
+    except _Overloaded:
+        return _busy_response()
+    except FetchError as e:
+        return jsonify({"error": str(e)}), e.status
+    except InvalidImage as e:
+        return jsonify({"error": str(e)}), 422
     except Exception as e:
         import traceback; traceback.print_exc()
         return jsonify({"error": str(e)}), 500
-    finally:
-        try:
-            os.remove(tmp_path); os.rmdir(tmp_dir)
-        except Exception:
-            pass
+
+
+@bp.route("/models/ensemble", methods=["GET"])
+def ensemble_info():
+    """Per-model memory cost and last observed latency of the local ensemble."""
+    try:
+        return jsonify({"enabled": USE_ENSEMBLE, "models": model_report()}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,6 @@
+# Backend/tests/conftest.py
+import os
+import sys
+
+# Backend modules import each other as top-level packages (models, utils, routes)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
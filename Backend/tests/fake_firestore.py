@@ -0,0 +1,141 @@
+# Backend/tests/fake_firestore.py
+"""
+Small in-memory stand-in for the Firestore client, covering what the backend
+uses: collection/document refs, get/set(merge), stream/order_by,
+list_documents, batches, transactions, Increment and SERVER_TIMESTAMP.
+"""
+
+import datetime
+import uuid
+
+from google.cloud import firestore as gcfs
+
+
+def _resolve(old, new, merge, now):
+    out = dict(old) if merge else {}
+    for key, value in new.items():
+        if isinstance(value, gcfs.Increment):
+            out[key] = ((old or {}).get(key) or 0) + value.value
+        elif value is gcfs.SERVER_TIMESTAMP:
+            out[key] = now
+        elif isinstance(value, dict):
+            prev = (old or {}).get(key) if merge else None
+            out[key] = _resolve(prev if isinstance(prev, dict) else {}, value, merge, now)
+        else:
+            out[key] = value
+    return out
+
+
+class FakeSnapshot:
+    def __init__(self, ref, data):
+        self.reference = ref
+        self.id = ref.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+        self.id = path[-1]
+
+    def collection(self, name):
+        return FakeCollection(self._db, self.path + (name,))
+
+    def get(self, transaction=None):
+        return FakeSnapshot(self, self._db.docs.get(self.path))
+
+    def set(self, data, merge=False):
+        self._db.apply([(self, data, merge)])
+
+
+class FakeCollection:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+        self.id = path[-1]
+
+    def document(self, doc_id=None):
+        return FakeDocument(self._db, self.path + (doc_id or uuid.uuid4().hex,))
+
+    def order_by(self, *args, **kwargs):
+        return self  # documents are always streamed in id order
+
+    def stream(self, transaction=None):
+        n = len(self.path) + 1
+        paths = sorted(p for p in self._db.docs if len(p) == n and p[:-1] == self.path)
+        return iter([FakeSnapshot(FakeDocument(self._db, p), self._db.docs[p]) for p in paths])
+
+    def list_documents(self):
+        # Like Firestore, includes "missing" parents that only have subcollections
+        n = len(self.path)
+        ids = sorted({p[n] for p in self._db.docs if len(p) > n and p[:n] == self.path})
+        return [self.document(i) for i in ids]
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self._db = db
+        self._ops = []
+
+    def set(self, ref, data, merge=False):
+        self._ops.append((ref, data, merge))
+
+    def commit(self):
+        self._db.apply(self._ops)
+        self._ops = []
+
+
+class FakeTransaction(FakeBatch):
+    """Buffers writes like a batch; reads go straight to the store."""
+
+    def get(self, ref_or_query):
+        if isinstance(ref_or_query, FakeDocument):
+            return ref_or_query.get()
+        return ref_or_query.stream()
+
+    def rollback(self):
+        self._ops = []
+
+
+def transactional(fn):
+    """
+    Stand-in for gcfs.transactional: run `fn` once, commit on success and
+    drop the buffered writes on error. Tests patch it over the real decorator,
+    which drives private Transaction internals that differ between releases.
+    """
+    def run(transaction, *args, **kwargs):
+        try:
+            result = fn(transaction, *args, **kwargs)
+        except BaseException:
+            transaction.rollback()
+            raise
+        transaction.commit()
+        return result
+    return run
+
+
+class FakeFirestore:
+    def __init__(self):
+        self.docs = {}  # path tuple -> dict
+        self.commits = 0
+
+    def collection(self, name):
+        return FakeCollection(self, (name,))
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+    def apply(self, ops):
+        """Apply writes atomically with one server timestamp, like a commit."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for ref, data, merge in ops:
+            self.docs[ref.path] = _resolve(self.docs.get(ref.path) or {}, data, merge, now)
+        self.commits += 1
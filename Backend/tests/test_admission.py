@@ -0,0 +1,35 @@
+# Backend/tests/test_admission.py
+import time
+
+from utils.admission import AdmissionController
+
+
+def _run(ctl, ms, record=True):
+    ticket = ctl.try_acquire()
+    ticket.t0 -= ms / 1000.0
+    ctl.release(ticket, record=record)
+    return ticket.level
+
+
+def test_levels_follow_in_flight_and_shed_at_limit():
+    ctl = AdmissionController(inflight_marks=(1, 2, 3), latency_marks_ms=(10**6,), max_in_flight=3)
+    tickets = [ctl.try_acquire() for _ in range(3)]
+    assert [t.level for t in tickets] == [0, 1, 2]
+    assert ctl.try_acquire() is None
+    ctl.release(tickets[0])
+    assert ctl.try_acquire() is not None
+
+
+def test_stale_slow_sample_ages_out():
+    ctl = AdmissionController(latency_marks_ms=(1500, 3000, 5000), max_age_s=0.2)
+    _run(ctl, 8000)
+    assert _run(ctl, 5) == 3
+    time.sleep(0.25)
+    assert [_run(ctl, 5) for _ in range(5)] == [0] * 5
+
+
+def test_unrecorded_warmup_does_not_degrade():
+    ctl = AdmissionController(latency_marks_ms=(1500, 3000, 5000))
+    _run(ctl, 8000, record=False)
+    assert [_run(ctl, 5) for _ in range(20)] == [0] * 20
+    assert ctl.retry_after() == 1
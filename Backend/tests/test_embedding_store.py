@@ -0,0 +1,95 @@
+# Backend/tests/test_embedding_store.py
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+from models import detector
+from models.embedding_store import EmbeddingStore, file_hash
+
+
+def _rows(value, n=2, dim=3):
+    return np.full((n, dim), value, dtype=np.float32)
+
+
+def test_put_get_and_reload(tmp_path):
+    store = EmbeddingStore(str(tmp_path), "bb@1")
+    assert store.put("A", _rows(1))
+    assert not store.put("A", _rows(9))
+    store.put("B", _rows(2, n=3))
+    again = EmbeddingStore(str(tmp_path), "bb@1")
+    assert len(again) == 5
+    np.testing.assert_array_equal(again.get("B"), _rows(2, n=3))
+
+
+@pytest.mark.parametrize("orphan", [_rows(7).tobytes(), _rows(7).tobytes()[:5]])
+def test_crash_between_appends_does_not_shift_rows(tmp_path, orphan):
+    store = EmbeddingStore(str(tmp_path), "bb@1")
+    store.put("A", _rows(1))
+    # emb.f32 written for B (whole or torn), keys.tsv never was
+    with open(store._emb_path, "ab") as f:
+        f.write(orphan)
+
+    store = EmbeddingStore(str(tmp_path), "bb@1")
+    assert len(store) == 2 and "B" not in store
+    store.put("C", _rows(5))
+    np.testing.assert_array_equal(store.get("C"), _rows(5))
+    reloaded = EmbeddingStore(str(tmp_path), "bb@1")
+    np.testing.assert_array_equal(reloaded.get("C"), _rows(5))
+    np.testing.assert_array_equal(reloaded.get("A"), _rows(1))
+
+
+def test_torn_keys_tail_is_dropped(tmp_path):
+    store = EmbeddingStore(str(tmp_path), "bb@1")
+    store.put("A", _rows(1))
+    with open(store._keys_path, "a") as f:
+        f.write("B\t")  # crashed mid-line, no rows written
+
+    store = EmbeddingStore(str(tmp_path), "bb@1")
+    store.put("C", _rows(5))
+    reloaded = EmbeddingStore(str(tmp_path), "bb@1")
+    assert sorted(reloaded.hashes()) == ["A", "C"]
+    np.testing.assert_array_equal(reloaded.get("C"), _rows(5))
+
+
+@pytest.fixture
+def tiny_model(monkeypatch, tmp_path):
+    from transformers import ViTConfig, ViTForImageClassification, ViTImageProcessor
+
+    cfg = ViTConfig(hidden_size=32, num_hidden_layers=1, num_attention_heads=2, intermediate_size=64,
+                    image_size=32, patch_size=16, num_labels=2, id2label={0: "real", 1: "fake"})
+    torch.manual_seed(0)
+    monkeypatch.setattr(detector, "_PROCESSOR", ViTImageProcessor(size={"height": 32, "width": 32}))
+    monkeypatch.setattr(detector, "_MODEL", ViTForImageClassification(cfg).eval())
+    monkeypatch.setattr(detector, "EMBEDDING_STORE_DIR", str(tmp_path / "emb"))
+    monkeypatch.setattr(detector, "_STORE", None)
+    monkeypatch.setattr(detector, "INVERT_LOCAL_PROB", False)
+
+
+def test_rescore_matches_full_inference(tiny_model, tmp_path):
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"img{i}.png"
+        Image.fromarray((np.random.RandomState(i).rand(48, 64, 3) * 255).astype("uint8")).save(path)
+        paths.append(str(path))
+
+    full = {file_hash(p): detector.detect_image_tta(p, return_embeddings=True) for p in paths}
+    assert all(r["embeddings"].shape == (4, 32) for r in full.values())
+    assert len(detector.get_embedding_store()) == 12
+
+    rescored = detector.rescore_archive()
+    for h, r in full.items():
+        assert rescored[h]["n"] == 4
+        assert rescored[h]["p_fake"] == pytest.approx(r["p_fake"], abs=1e-5)
+        assert rescored[h]["p_fake_std"] == pytest.approx(r["p_fake_std"], abs=1e-5)
+
+    inverted = detector.rescore_archive(invert=True)
+    for h, r in full.items():
+        assert inverted[h]["p_fake"] == pytest.approx(1.0 - r["p_fake"], abs=1e-5)
+
+
+def test_reduced_tta_is_not_archived(tiny_model, tmp_path):
+    path = tmp_path / "img.png"
+    Image.new("RGB", (40, 40), (10, 200, 30)).save(path)
+    detector.detect_image_tta(str(path), n_variants=2)
+    assert len(detector.get_embedding_store()) == 0
@@ -0,0 +1,116 @@
+# Backend/tests/test_registry.py
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+from models import detector, registry
+
+
+class _CountingProcessor:
+    """Wraps an image processor and counts preprocessing calls."""
+
+    def __init__(self, inner, calls):
+        self._inner = inner
+        self._calls = calls
+
+    def to_dict(self):
+        return self._inner.to_dict()
+
+    def __call__(self, *args, **kwargs):
+        self._calls.append(1)
+        return self._inner(*args, **kwargs)
+
+
+def _model(seed):
+    from transformers import ViTConfig, ViTForImageClassification
+
+    cfg = ViTConfig(hidden_size=32, num_hidden_layers=1, num_attention_heads=2, intermediate_size=64,
+                    image_size=32, patch_size=16, num_labels=2, id2label={0: "real", 1: "fake"})
+    torch.manual_seed(seed)
+    return ViTForImageClassification(cfg).eval()
+
+
+def _processor(calls, mean=0.5):
+    from transformers import ViTImageProcessor
+    inner = ViTImageProcessor(size={"height": 32, "width": 32}, image_mean=[mean] * 3)
+    return _CountingProcessor(inner, calls)
+
+
+@pytest.fixture(autouse=True)
+def clean_registry(monkeypatch):
+    monkeypatch.setattr(registry, "_ENTRIES", {})
+    monkeypatch.setattr(registry, "_FAILED", {})
+    monkeypatch.setattr(registry, "ENSEMBLE_MODEL_IDS", [])
+
+
+@pytest.fixture
+def image():
+    return Image.fromarray((np.random.RandomState(0).rand(40, 40, 3) * 255).astype("uint8"))
+
+
+def test_same_processor_config_is_preprocessed_once(image):
+    calls = []
+    registry.register_model("a", _processor(calls), _model(1))
+    registry.register_model("b", _processor(calls), _model(2))
+    registry.register_model("c", _processor(calls, mean=0.4), _model(3))
+    registry.ENSEMBLE_MODEL_IDS[:] = ["a", "b", "c"]
+
+    votes = registry.ensemble_predict([image])
+    assert [v["model_id"] for v in votes] == ["a", "b", "c"]
+    assert len(calls) == 2  # a and b share pixel_values, c differs
+    assert all(0.0 <= v["p_fake"] <= 1.0 for v in votes)
+
+
+def test_primary_entry_reuses_tta_score(monkeypatch, image):
+    calls = []
+    monkeypatch.setattr(detector, "_PROCESSOR", _processor(calls))
+    monkeypatch.setattr(detector, "_MODEL", _model(1))
+    registry.register_model(detector.MODEL_ID)
+    registry.ENSEMBLE_MODEL_IDS[:] = [detector.MODEL_ID]
+
+    report = registry.model_report()
+    assert report[0]["shared_with_primary"] and report[0]["memory_bytes"] == 0
+
+    votes = registry.ensemble_predict([image], primary_p_fake=0.73)
+    assert votes == [{"model_id": detector.MODEL_ID, "p_fake": 0.73, "latency_ms": 0.0}]
+    assert calls == []
+
+    # without a primary score it falls back to a real forward pass
+    fresh = registry.ensemble_predict([image])[0]["p_fake"]
+    assert fresh == pytest.approx(float(detector._predict_batch([image])[0]), abs=1e-6)
+
+
+def test_failed_checkpoint_is_not_retried(monkeypatch, image):
+    import transformers
+
+    attempts = []
+
+    def boom(model_id, *args, **kwargs):
+        attempts.append(model_id)
+        raise OSError("no such checkpoint")
+
+    monkeypatch.setattr(transformers.AutoImageProcessor, "from_pretrained", boom)
+    registry.register_model("ok", _processor([]), _model(1))
+    registry.ENSEMBLE_MODEL_IDS[:] = ["ok", "missing/model"]
+
+    for _ in range(3):
+        votes = registry.ensemble_predict([image])
+        assert [v["model_id"] for v in votes] == ["ok"]
+    assert attempts == ["missing/model"]
+
+    report = {r["model_id"]: r for r in registry.model_report()}
+    assert "no such checkpoint" in report["missing/model"]["error"]
+    assert registry.is_loaded()
+
+
+def test_report_includes_memory_cost():
+    model = _model(1)
+    registry.register_model("a", _processor([]), model)
+    registry.ENSEMBLE_MODEL_IDS[:] = ["a"]
+
+    (entry,) = registry.model_report()
+    expected = sum(t.numel() * t.element_size() for t in list(model.parameters()) + list(model.buffers()))
+    assert entry["memory_bytes"] == expected > 0
+    assert entry["last_latency_ms"] is None
+    assert {"model", "processor"}.isdisjoint(entry)
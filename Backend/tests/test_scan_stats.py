@@ -0,0 +1,112 @@
+# Backend/tests/test_scan_stats.py
+import datetime
+import sys
+import types
+
+import pytest
+
+from tests import fake_firestore
+from tests.fake_firestore import FakeFirestore
+from utils import scan_stats
+
+
+def _scan(decision, confidence):
+    return {"filename": "x.jpg", "decision": decision, "confidence": confidence, "threshold": 0.8}
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(scan_stats.gcfs, "transactional", fake_firestore.transactional)
+    return FakeFirestore()
+
+
+@pytest.fixture
+def stats_client(db, monkeypatch):
+    monkeypatch.setitem(sys.modules, "firebase_admin_init", types.SimpleNamespace(db=db))
+    from flask import Flask
+    from routes import history
+
+    monkeypatch.setattr(history, "db", db)
+    app = Flask(__name__)
+    app.register_blueprint(history.history_bp)
+    return app.test_client()
+
+
+def test_confidence_bucket_edges():
+    assert scan_stats.confidence_bucket(0.0) == "0"
+    assert scan_stats.confidence_bucket(0.55) == "5"
+    assert scan_stats.confidence_bucket(0.999) == "9"
+    assert scan_stats.confidence_bucket(1.0) == "9"
+    assert scan_stats.confidence_bucket(1.7) == "9"
+    assert scan_stats.confidence_bucket(None) == "0"
+
+
+def test_get_stats_missing_doc_is_zero(db):
+    assert scan_stats.get_stats(db, "nobody") == scan_stats.empty_stats()
+
+
+def test_record_scan_increments_atomically(db):
+    scan_stats.record_scan(db, "u1", _scan("fake", 0.91))
+    scan_stats.record_scan(db, "u1", _scan("real", 1.0))
+    scan_stats.record_scan(db, "u1", _scan("fake", 0.55))
+
+    stats = scan_stats.get_stats(db, "u1")
+    assert (stats["total"], stats["fake"], stats["real"]) == (3, 2, 1)
+    assert stats["confidenceBuckets"]["9"] == 2
+    assert stats["confidenceBuckets"]["5"] == 1
+    assert sum(stats["confidenceBuckets"].values()) == 3
+    assert isinstance(stats["lastScanAt"], datetime.datetime)
+
+    # history + aggregate land in the same commit
+    assert db.commits == 3
+    history = list(db.collection("users").document("u1").collection("scans").stream())
+    assert len(history) == 3
+    assert all(isinstance(s.to_dict()["timestamp"], datetime.datetime) for s in history)
+
+
+def test_rebuild_matches_incremental(db):
+    for decision, conf in [("fake", 0.91), ("real", 0.42), ("real", 1.0), ("fake", 0.05)]:
+        scan_stats.record_scan(db, "u1", _scan(decision, conf))
+    incremental = scan_stats.get_stats(db, "u1")
+
+    scan_stats.stats_ref(db, "u1").set({"total": 999})
+    rebuilt = scan_stats.rebuild_stats(db, "u1")
+
+    assert rebuilt == incremental
+    assert scan_stats.get_stats(db, "u1") == incremental
+
+
+def test_backfill_covers_every_user(db):
+    scan_stats.record_scan(db, "u1", _scan("fake", 0.9))
+    scan_stats.record_scan(db, "u2", _scan("real", 0.3))
+    scan_stats.record_scan(db, "u2", _scan("real", 0.8))
+    expected = {u: scan_stats.get_stats(db, u) for u in ("u1", "u2")}
+
+    for u in expected:
+        del db.docs[scan_stats.stats_ref(db, u).path]
+    # legacy history without a server timestamp
+    db.collection("users").document("u3").collection("scans").document().set(
+        {"decision": "fake", "confidence": 0.7, "createdAt": 1722800000.0})
+
+    assert scan_stats.backfill(db) == 3
+    for u, stats in expected.items():
+        assert scan_stats.get_stats(db, u) == stats
+    u3 = scan_stats.get_stats(db, "u3")
+    assert (u3["total"], u3["fake"], u3["confidenceBuckets"]["7"]) == (1, 1, 1)
+    assert u3["lastScanAt"] == datetime.datetime.fromtimestamp(1722800000.0, tz=datetime.timezone.utc)
+
+
+def test_stats_endpoint_formats_and_ratios(db, stats_client):
+    empty = stats_client.post("/history/stats", json={"userId": "nobody"}).get_json()
+    assert (empty["total"], empty["lastScanAt"]) == (0, "")
+    assert (empty["fakeRatio"], empty["realRatio"]) == (0.0, 0.0)
+
+    scan_stats.stats_ref(db, "u1").set({
+        "total": 4, "fake": 1, "real": 3,
+        "lastScanAt": datetime.datetime(2026, 10, 1, 8, 5, 9, tzinfo=datetime.timezone.utc),
+    })
+    stats = stats_client.post("/history/stats", json={"userId": "u1"}).get_json()
+    assert stats["lastScanAt"] == "2026-10-01 08:05:09"
+    assert (stats["fakeRatio"], stats["realRatio"]) == (0.25, 0.75)
+
+    assert stats_client.post("/history/stats", json={}).status_code == 400
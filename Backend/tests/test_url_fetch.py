@@ -0,0 +1,241 @@
+# Backend/tests/test_url_fetch.py
+import sys
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from tests.fake_firestore import FakeFirestore
+from utils import url_fetch
+from utils.url_fetch import FetchError, SingleFlight, fetch_image
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\0" * 200
+ETAG = '"v1"'
+LAST_MODIFIED = "Wed, 21 Oct 2026 07:28:00 GMT"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    hits = {}
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b"", headers=None):
+        self.send_response(status)
+        headers = dict(headers or {})
+        headers.setdefault("Content-Length", str(len(body)))
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        type(self).hits[path] = type(self).hits.get(path, 0) + 1
+        png = {"Content-Type": "image/png"}
+
+        if path == "/img":
+            self._send(200, PNG, png)
+        elif path == "/big-declared":
+            self._send(200, b"\0" * 4096, png)
+        elif path == "/big-chunked":
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for _ in range(8):
+                self.wfile.write(b"200\r\n" + b"\0" * 512 + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+        elif path == "/html":
+            self._send(200, b"<html></html>", {"Content-Type": "text/html"})
+        elif path == "/etag":
+            if self.headers.get("If-None-Match") == ETAG:
+                self._send(304, headers={"ETag": ETAG})
+            else:
+                self._send(200, PNG, {**png, "ETag": ETAG})
+        elif path == "/last-modified":
+            if self.headers.get("If-Modified-Since") == LAST_MODIFIED:
+                self._send(304)
+            else:
+                self._send(200, PNG, {**png, "Last-Modified": LAST_MODIFIED})
+        elif path == "/slow":
+            time.sleep(0.3)
+            self._send(200, PNG, {**png, "ETag": ETAG})
+        elif path == "/drip":
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", "100")
+            self.end_headers()
+            for _ in range(100):
+                self.wfile.write(b"\0")
+                self.wfile.flush()
+                time.sleep(0.1)
+        elif path == "/garbage":
+            self._send(200, b"not really a png", png)
+        elif path == "/redirect-loopback":
+            port = self.server.server_address[1]
+            self._send(302, headers={"Location": f"http://127.0.0.2:{port}/img"})
+        else:
+            self._send(404)
+
+
+@pytest.fixture(scope="module")
+def server():
+    srv = ThreadingHTTPServer(("0.0.0.0", 0), _Handler)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{srv.server_address[1]}"
+    srv.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def local_ok(monkeypatch):
+    _Handler.hits = {}
+    monkeypatch.setattr(url_fetch, "ALLOW_PRIVATE", True)
+
+
+def test_fetches_image(server):
+    r = fetch_image(server + "/img")
+    assert (r.status, r.data, r.content_type) == (200, PNG, "image/png")
+
+
+@pytest.mark.parametrize("path", ["/big-declared", "/big-chunked"])
+def test_byte_cap(server, monkeypatch, path):
+    monkeypatch.setattr(url_fetch, "MAX_BYTES", 1024)
+    with pytest.raises(FetchError) as e:
+        fetch_image(server + path)
+    assert e.value.status == 413
+
+
+def test_rejects_non_image(server):
+    with pytest.raises(FetchError) as e:
+        fetch_image(server + "/html")
+    assert e.value.status == 415
+
+
+def test_total_deadline_beats_slow_drip(server, monkeypatch):
+    monkeypatch.setattr(url_fetch, "TOTAL_TIMEOUT", 0.5)
+    t0 = time.monotonic()
+    with pytest.raises(FetchError) as e:
+        fetch_image(server + "/drip")
+    assert e.value.status == 504
+    assert time.monotonic() - t0 < 1.5
+
+
+def test_conditional_get(server):
+    first = fetch_image(server + "/etag")
+    again = fetch_image(server + "/etag", etag=first.etag)
+    assert again.not_modified and again.etag == ETAG
+
+    first = fetch_image(server + "/last-modified")
+    again = fetch_image(server + "/last-modified", last_modified=first.last_modified)
+    assert again.not_modified and again.last_modified == LAST_MODIFIED
+
+
+def test_single_flight_coalesces(server):
+    flights, out = SingleFlight(), []
+    url = server + "/slow"
+    threads = [threading.Thread(target=lambda: out.append(flights.do(url, lambda: fetch_image(url))))
+               for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert _Handler.hits["/slow"] == 1
+    assert sorted(shared for _, shared in out) == [False, True]
+    assert out[0][0] is out[1][0]
+
+
+def test_redirect_to_loopback_refused(server, monkeypatch):
+    # Treat the test server's own address as "public"; everything else is not
+    monkeypatch.setattr(url_fetch, "ALLOW_PRIVATE", False)
+    monkeypatch.setattr(url_fetch, "_ip_allowed", lambda ip: ip == "127.0.0.1")
+    with pytest.raises(FetchError) as e:
+        fetch_image(server + "/redirect-loopback")
+    assert e.value.status == 400
+    assert _Handler.hits.get("/redirect-loopback") == 1
+    assert "/img" not in _Handler.hits
+
+
+def test_private_peer_refused_before_request_is_sent(server, monkeypatch):
+    # "localhost" passes the pre-flight check; the connected peer does not
+    monkeypatch.setattr(url_fetch, "ALLOW_PRIVATE", False)
+    port = server.rsplit(":", 1)[1]
+    with pytest.raises(FetchError) as e:
+        fetch_image(f"http://localhost:{port}/img")
+    assert e.value.status == 400
+    assert _Handler.hits == {}
+
+
+@pytest.fixture
+def scan_routes(monkeypatch):
+    monkeypatch.setitem(sys.modules, "firebase_admin_init",
+                        types.SimpleNamespace(db=FakeFirestore()))
+    from routes import scan as scan_routes
+    from flask import Flask
+
+    calls = []
+
+    def fake_analyze(data, level):
+        calls.append(data)
+        return {"decision": "real", "confidence": 0.9, "threshold": 0.8, "signals": {"degradation_level": level}}
+
+    real_analyze = scan_routes._analyze
+    monkeypatch.setattr(scan_routes, "_analyze", fake_analyze)
+    monkeypatch.setattr(scan_routes, "_models_warm", lambda: True)
+    monkeypatch.setattr(scan_routes, "URL_CACHE", url_fetch.UrlResultCache())
+    app = Flask(__name__)
+    app.register_blueprint(scan_routes.bp)
+    client = app.test_client()
+    client.real_analyze = real_analyze
+    return client, calls
+
+
+@pytest.mark.parametrize("path", ["/etag", "/last-modified"])
+def test_scan_url_revalidates(server, scan_routes, path):
+    client, calls = scan_routes
+    first = client.post("/scan/url", json={"url": server + path}).get_json()
+    second = client.post("/scan/url", json={"url": server + path}).get_json()
+    assert (first["cache"], second["cache"]) == ("miss", "revalidated")
+    assert second["decision"] == "real"
+    assert calls == [PNG]
+    assert _Handler.hits[path] == 2
+
+
+def test_scan_url_maps_fetch_errors(server, scan_routes):
+    client, _ = scan_routes
+    resp = client.post("/scan/url", json={"url": server + "/html"})
+    assert resp.status_code == 415
+    assert client.post("/scan/url", json={}).status_code == 400
+
+
+def test_scan_url_rejects_bad_input(scan_routes):
+    client, calls = scan_routes
+    assert client.post("/scan/url", json={"url": 5}).status_code == 400
+    assert client.post("/scan/url", json=["http://example.com/a.png"]).status_code == 400
+    assert client.post("/scan/url", json={"url": "http://x", "userId": 7}).status_code == 400
+    assert client.post("/scan/url", json={"url": "http://[::1"}).status_code == 400
+    assert calls == []
+
+
+def test_scan_url_undecodable_image(server, scan_routes, monkeypatch):
+    from routes import scan as scan_module
+    client, _ = scan_routes
+    monkeypatch.setattr(scan_module, "_analyze", client.real_analyze)
+    resp = client.post("/scan/url", json={"url": server + "/garbage"})
+    assert resp.status_code == 422
+    assert scan_module.ADMISSION.snapshot()["in_flight"] == 0
+
+
+def test_scan_url_sheds_before_fetching(server, scan_routes, monkeypatch):
+    from routes import scan as scan_module
+    from utils.admission import AdmissionController
+    client, calls = scan_routes
+    monkeypatch.setattr(scan_module, "ADMISSION", AdmissionController(max_in_flight=0))
+    resp = client.post("/scan/url", json={"url": server + "/img"})
+    assert resp.status_code == 503 and resp.headers.get("Retry-After")
+    assert _Handler.hits == {} and calls == []
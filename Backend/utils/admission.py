@@ -0,0 +1,153 @@
+# Backend/utils/admission.py
+"""
+Load-aware admission control for the scan pipeline.
+
+Tracks in-flight scans and a window of recent latencies. Past each watermark
+the pipeline degrades one step instead of letting latency explode for everyone:
+
+  level 0  full pipeline
+  level 1  fewer TTA variants (original + mirror)
+  level 2  + ELA on a downscaled image
+  level 3  + skip the second opinion (ensemble / HF API)
+
+At MAX_IN_FLIGHT new scans are shed (503 + Retry-After) rather than queued.
+
+Load test against a running server:
+  python -m utils.admission loadtest <image> [--url http://127.0.0.1:5000/scan]
+"""
+
+import argparse
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+
+def _env_ints(name: str, default: str):
+    return tuple(int(x) for x in os.getenv(name, default).split(",") if x.strip())
+
+
+# --- Watermarks (level 1, 2, 3) ---
+INFLIGHT_MARKS   = _env_ints("ADMISSION_INFLIGHT_MARKS", "2,4,6")
+LATENCY_MARKS_MS = _env_ints("ADMISSION_LATENCY_MARKS_MS", "1500,3000,5000")
+MAX_IN_FLIGHT    = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "8"))
+LATENCY_WINDOW   = 50     # most recent samples kept ...
+LATENCY_MAX_AGE  = float(os.getenv("ADMISSION_LATENCY_MAX_AGE_S", "30"))  # ... and only this fresh
+
+LEVEL_NAMES = ("full", "reduced_tta", "downscaled_ela", "no_second_opinion")
+
+# What each level does to the pipeline
+TTA_VARIANTS_AT = (4, 2, 2, 2)
+ELA_MAX_SIDE_AT = (None, None, 512, 512)
+SECOND_OPINION_AT = (True, True, True, False)
+
+
+class Ticket:
+    __slots__ = ("level", "t0")
+
+    def __init__(self, level: int):
+        self.level = level
+        self.t0 = time.perf_counter()
+
+
+class AdmissionController:
+    def __init__(self, inflight_marks=INFLIGHT_MARKS, latency_marks_ms=LATENCY_MARKS_MS,
+                 max_in_flight=MAX_IN_FLIGHT, window=LATENCY_WINDOW, max_age_s=LATENCY_MAX_AGE):
+        self.inflight_marks = tuple(inflight_marks)
+        self.latency_marks_ms = tuple(latency_marks_ms)
+        self.max_in_flight = int(max_in_flight)
+        self.max_age_s = float(max_age_s)
+        self._latencies = deque(maxlen=window)   # (monotonic time, ms)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _level_for(value: float, marks) -> int:
+        return sum(1 for m in marks if value >= m)
+
+    def _recent_p95_ms(self) -> float:
+        # Age out stale samples so a quiet server recovers to level 0
+        cutoff = time.monotonic() - self.max_age_s
+        while self._latencies and self._latencies[0][0] < cutoff:
+            self._latencies.popleft()
+        if not self._latencies:
+            return 0.0
+        ordered = sorted(ms for _, ms in self._latencies)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def try_acquire(self) -> Optional[Ticket]:
+        """Admit a scan and pick its degradation level, or return None to shed it."""
+        with self._lock:
+            if self._in_flight >= self.max_in_flight:
+                return None
+            level = max(
+                self._level_for(self._in_flight, self.inflight_marks),
+                self._level_for(self._recent_p95_ms(), self.latency_marks_ms),
+            )
+            self._in_flight += 1
+            return Ticket(min(level, len(LEVEL_NAMES) - 1))
+
+    def release(self, ticket: Ticket, record: bool = True) -> None:
+        """
+        Finish a scan. Pass record=False for scans whose latency is not
+        representative (e.g. the one that lazily loaded the models).
+        """
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+            if record:
+                self._latencies.append((time.monotonic(), (time.perf_counter() - ticket.t0) * 1000.0))
+
+    def retry_after(self) -> int:
+        """Seconds a shed client should wait: roughly one recent scan latency."""
+        with self._lock:
+            return max(1, math.ceil(self._recent_p95_ms() / 1000.0))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"in_flight": self._in_flight, "p95_ms": self._recent_p95_ms()}
+
+
+def _loadtest(image: str, url: str, levels, per_level: int):
+    import requests
+    from concurrent.futures import ThreadPoolExecutor
+
+    with open(image, "rb") as f:
+        data = f.read()
+    name = os.path.basename(image)
+    session = requests.Session()
+
+    def one(_):
+        t0 = time.perf_counter()
+        try:
+            r = session.post(url, files={"file": (name, data)}, timeout=120)
+            status = r.status_code
+            level = (r.json().get("signals") or {}).get("degradation_level") if status == 200 else None
+        except Exception:
+            status, level = 0, None
+        return (time.perf_counter() - t0) * 1000.0, status, level
+
+    print(f"{'conc':>5} {'ok':>5} {'shed':>5} {'err':>4} {'p50 ms':>9} {'p99 ms':>9}  levels")
+    for conc in levels:
+        with ThreadPoolExecutor(max_workers=conc) as pool:
+            results = list(pool.map(one, range(conc * per_level)))
+        ok = sorted(ms for ms, st, _ in results if st == 200)
+        shed = sum(1 for _, st, _ in results if st in (429, 503))
+        err = len(results) - len(ok) - shed
+        pct = lambda q: ok[min(len(ok) - 1, int(q * len(ok)))] if ok else float("nan")
+        seen = sorted({lv for _, st, lv in results if lv is not None})
+        print(f"{conc:>5} {len(ok):>5} {shed:>5} {err:>4} {pct(0.50):>9.0f} {pct(0.99):>9.0f}  {seen}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Admission control utilities.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    lt = sub.add_parser("loadtest", help="Ramp concurrent /scan requests and report p50/p99")
+    lt.add_argument("image")
+    lt.add_argument("--url", default="http://127.0.0.1:5000/scan")
+    lt.add_argument("--levels", default="1,2,4,8,16,32", help="Concurrency steps")
+    lt.add_argument("--per-level", type=int, default=4, help="Requests per client per step")
+    args = parser.parse_args()
+    if args.cmd == "loadtest":
+        _loadtest(args.image, args.url, [int(x) for x in args.levels.split(",")], args.per_level)
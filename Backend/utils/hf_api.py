@@ -13,8 +13,9 @@ def _label_to_kind(label: str) -> str:
     if any(k in l for k in _REAL_KEYS): return "real"
     return "other"
 
-def call_hf_api(image_path: str, timeout: float = 6.0, warm_tries: int = 2):
+def call_hf_api(image, timeout: float = 6.0, warm_tries: int = 2):
     """
+    `image` is a file path or the raw image bytes.
     Returns p_fake in [0,1] if inferable, else None.
     Retries once if the model is warming up (HF often returns 503 / loading JSON).
     """
@@ -25,8 +26,11 @@ def call_hf_api(image_path: str, timeout: float = 6.0, warm_tries: int = 2):
     url = f"https://api-inference.huggingface.co/models/{HF_MODEL}"
     headers = {"Authorization": f"Bearer {HF_API_TOKEN}"}
 
-    with open(image_path, "rb") as f:
-        data = f.read()
+    if isinstance(image, (bytes, bytearray)):
+        data = bytes(image)
+    else:
+        with open(image, "rb") as f:
+            data = f.read()
 
     tries = 0
     while tries < max(1, warm_tries):
@@ -5,16 +5,25 @@ Lightweight, dependency-friendly image signals:
 - EXIF hints (presence + Software tag)
 - Laplacian variance (sharpness/noise) — uses OpenCV if available
 
+Each function takes either a file path or the raw image bytes, so uploads and
+URL fetches can be analysed without touching disk.
+
 All functions are defensive: they return None / safe defaults on failure.
 """
 
 from io import BytesIO
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Union
 
 from PIL import Image, ImageChops, ImageStat, ImageEnhance, ExifTags
 
+ImageSource = Union[str, bytes]
+
+
+def _open(source: ImageSource) -> Image.Image:
+    return Image.open(BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
 
-def ela_score(path: str, quality: int = 95) -> Optional[float]:
+
+def ela_score(source: ImageSource, quality: int = 95, max_side: Optional[int] = None) -> Optional[float]:
     """
     Compute a simple Error Level Analysis score.
     Higher ≈ more compression inconsistencies (often seen in AI/composited images).
@@ -24,10 +33,14 @@ def ela_score(path: str, quality: int = 95) -> Optional[float]:
       ~15–30 : high
     Always CALIBRATE on your own set.
 
+    `max_side` downscales the image first (cheaper, slightly less sensitive).
+
     Returns: float (mean brightness of the ELA diff, 0..~30+), or None on error.
     """
     try:
-        orig = Image.open(path).convert("RGB")
+        orig = _open(source).convert("RGB")
+        if max_side and max(orig.size) > max_side:
+            orig.thumbnail((max_side, max_side), Image.BILINEAR)
         tmp = BytesIO()
         orig.save(tmp, "JPEG", quality=quality)
         tmp.seek(0)
@@ -47,7 +60,7 @@ def ela_score(path: str, quality: int = 95) -> Optional[float]:
         return None
 
 
-def exif_hints(path: str) -> Dict[str, Any]:
+def exif_hints(source: ImageSource) -> Dict[str, Any]:
     """
     Return very basic EXIF hints:
       - has_exif: bool
@@ -56,7 +69,7 @@ def exif_hints(path: str) -> Dict[str, Any]:
     """
     hints = {"has_exif": False, "software": None}
     try:
-        img = Image.open(path)
+        img = _open(source)
         exif = img.getexif()
         if exif and len(exif.items()) > 0:
             hints["has_exif"] = True
@@ -71,14 +84,18 @@ def exif_hints(path: str) -> Dict[str, Any]:
     return hints
 
 
-def laplacian_var(path: str) -> Optional[float]:
+def laplacian_var(source: ImageSource) -> Optional[float]:
     """
     Variance of Laplacian (focus/noise proxy). Requires OpenCV.
     Returns: float or None if cv2 not available or image unreadable.
     """
     try:
         import cv2  # type: ignore
-        img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if isinstance(source, (bytes, bytearray)):
+            import numpy as np
+            img = cv2.imdecode(np.frombuffer(source, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        else:
+            img = cv2.imread(source, cv2.IMREAD_GRAYSCALE)
         if img is None:
             return None
         return float(cv2.Laplacian(img, cv2.CV_64F).var())
@@ -0,0 +1,153 @@
+# Backend/utils/scan_stats.py
+"""
+Per-user scan aggregates kept next to the history:
+
+  users/{uid}/stats/scans = {
+      total, fake, real,
+      confidenceBuckets: {"0": n, ..., "9": n},   # 10 buckets of width 0.1
+      lastScanAt,
+  }
+
+scan() updates it with atomic increments in the same batch as the history
+write, so /history/stats is a single document read instead of streaming
+users/{uid}/scans. `python -m utils.scan_stats` rebuilds it from history.
+
+Every function takes the Firestore client explicitly so it can be used with
+an in-memory fake.
+"""
+
+import argparse
+import datetime
+from typing import Any, Dict, Optional
+
+from google.cloud import firestore as gcfs
+
+N_BUCKETS = 10
+
+
+def stats_ref(db, user_id: str):
+    return (db.collection("users")
+              .document(user_id)
+              .collection("stats")
+              .document("scans"))
+
+
+def confidence_bucket(confidence) -> str:
+    """Bucket index ("0".."9") for a confidence in [0,1]; 1.0 goes in the last bucket."""
+    try:
+        c = max(0.0, min(1.0, float(confidence)))
+    except Exception:
+        c = 0.0
+    return str(min(N_BUCKETS - 1, int(c * N_BUCKETS)))
+
+
+def empty_stats() -> Dict[str, Any]:
+    return {
+        "total": 0,
+        "fake": 0,
+        "real": 0,
+        "confidenceBuckets": {str(i): 0 for i in range(N_BUCKETS)},
+        "lastScanAt": None,
+    }
+
+
+def record_scan(db, user_id: str, record: Dict[str, Any]) -> None:
+    """
+    Write one history entry and bump the aggregate in a single atomic batch.
+    `record` is the history document (decision, confidence, ...); its
+    timestamp is set server-side.
+    """
+    decision = record.get("decision")
+    batch = db.batch()
+    scan_ref = (db.collection("users")
+                  .document(user_id)
+                  .collection("scans")
+                  .document())
+    batch.set(scan_ref, {**record, "timestamp": gcfs.SERVER_TIMESTAMP})
+    batch.set(stats_ref(db, user_id), {
+        "total": gcfs.Increment(1),
+        "fake": gcfs.Increment(1 if decision == "fake" else 0),
+        "real": gcfs.Increment(1 if decision == "real" else 0),
+        "confidenceBuckets": {confidence_bucket(record.get("confidence")): gcfs.Increment(1)},
+        "lastScanAt": gcfs.SERVER_TIMESTAMP,
+    }, merge=True)
+    batch.commit()
+
+
+def get_stats(db, user_id: str) -> Dict[str, Any]:
+    """Read the aggregate (one document). Missing fields fall back to zero."""
+    stats = empty_stats()
+    snap = stats_ref(db, user_id).get()
+    doc = (snap.to_dict() or {}) if snap.exists else {}
+    for key in ("total", "fake", "real"):
+        stats[key] = int(doc.get(key) or 0)
+    for k, v in (doc.get("confidenceBuckets") or {}).items():
+        stats["confidenceBuckets"][str(k)] = int(v or 0)
+    stats["lastScanAt"] = doc.get("lastScanAt")
+    return stats
+
+
+def _as_datetime(doc: Dict[str, Any]) -> Optional[datetime.datetime]:
+    ts = doc.get("timestamp")
+    if ts is not None:
+        dt = ts.to_datetime() if hasattr(ts, "to_datetime") else ts
+        return dt if isinstance(dt, datetime.datetime) else None
+    created_at = doc.get("createdAt")
+    if isinstance(created_at, (int, float)):
+        return datetime.datetime.fromtimestamp(created_at, tz=datetime.timezone.utc)
+    return None
+
+
+def rebuild_stats(db, user_id: str) -> Dict[str, Any]:
+    """
+    Recompute the aggregate from users/{uid}/scans and overwrite it.
+    The history read and the overwrite share one transaction, so a concurrent
+    record_scan() either lands before the read or forces a retry — its
+    increment is never overwritten.
+    """
+    scans = (db.collection("users")
+               .document(user_id)
+               .collection("scans")
+               .order_by("__name__"))
+    ref = stats_ref(db, user_id)
+
+    @gcfs.transactional
+    def _rebuild(transaction):
+        stats = empty_stats()
+        for snap in transaction.get(scans):
+            doc = snap.to_dict() or {}
+            decision = doc.get("decision")
+            stats["total"] += 1
+            if decision in ("fake", "real"):
+                stats[decision] += 1
+            stats["confidenceBuckets"][confidence_bucket(doc.get("confidence"))] += 1
+            dt = _as_datetime(doc)
+            if dt is not None and dt.tzinfo is None:
+                dt = dt.replace(tzinfo=datetime.timezone.utc)
+            if dt is not None and (stats["lastScanAt"] is None or dt > stats["lastScanAt"]):
+                stats["lastScanAt"] = dt
+        transaction.set(ref, stats)
+        return stats
+
+    return _rebuild(db.transaction())
+
+
+def backfill(db, user_ids=None) -> int:
+    """Rebuild aggregates for `user_ids` (default: every users/{uid}). Returns count."""
+    if not user_ids:
+        user_ids = [ref.id for ref in db.collection("users").list_documents()]
+    n = 0
+    for uid in user_ids:
+        stats = rebuild_stats(db, uid)
+        print(f"📊 {uid}: total={stats['total']} fake={stats['fake']} real={stats['real']}")
+        n += 1
+    return n
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild users/{uid}/stats/scans from history.")
+    parser.add_argument("user_ids", nargs="*", help="Users to rebuild (default: all)")
+    args = parser.parse_args()
+
+    from firebase_admin_init import db as _db
+    print(f"✅ Rebuilt stats for {backfill(_db, args.user_ids)} user(s)")
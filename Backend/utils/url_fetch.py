@@ -0,0 +1,288 @@
+# Backend/utils/url_fetch.py
+"""
+Server-side image fetching for /scan/url:
+
+- one pooled requests.Session shared by all requests
+- streamed download with a hard byte cap, content-type check and a
+  connect/read timeout plus an overall deadline enforced on every socket read
+- redirects followed by hand; every connection's peer address is checked
+  before the request is sent (no SSRF via redirects or DNS rebinding)
+- conditional GET (If-None-Match / If-Modified-Since) to revalidate cached results
+- UrlResultCache: scan results keyed by URL + ETag/Last-Modified
+- SingleFlight: concurrent requests for the same URL share one fetch + scan
+
+Private/loopback targets are refused unless URL_FETCH_ALLOW_PRIVATE=1
+(e.g. when testing against a local HTTP server).
+"""
+
+import ipaddress
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urljoin, urlparse
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+MAX_BYTES       = int(os.getenv("URL_FETCH_MAX_BYTES", str(10 * 1024 * 1024)))
+CONNECT_TIMEOUT = 3.0
+READ_TIMEOUT    = 5.0
+TOTAL_TIMEOUT   = 15.0   # overall deadline for the body download
+READ_CHUNK      = 16 * 1024
+MAX_REDIRECTS   = 3
+REDIRECT_CODES  = {301, 302, 303, 307, 308}
+ALLOWED_TYPES   = {"image/jpeg", "image/png", "image/webp", "image/bmp"}
+ALLOW_PRIVATE   = os.getenv("URL_FETCH_ALLOW_PRIVATE", "0") == "1"
+CACHE_ENTRIES   = 512
+
+
+class FetchError(RuntimeError):
+    """Fetch failed; `status` is the HTTP status to return to our client."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def _ip_allowed(ip: str) -> bool:
+    if ALLOW_PRIVATE:
+        return True
+    addr = ipaddress.ip_address(ip.split("%", 1)[0])
+    if getattr(addr, "ipv4_mapped", None):
+        addr = addr.ipv4_mapped
+    return addr.is_global and not addr.is_multicast
+
+
+def _check_peer(sock) -> None:
+    """Refuse the connection unless the address we actually reached is public."""
+    ip = sock.getpeername()[0]
+    if not _ip_allowed(ip):
+        sock.close()
+        raise FetchError("URL resolves to a non-public address", 400)
+
+
+# The address check runs on the connected socket, before any request bytes
+# are sent, so DNS rebinding between a check and the connect can't slip by.
+class _GuardedHTTPConnection(HTTPConnection):
+    def _new_conn(self):
+        sock = super()._new_conn()
+        _check_peer(sock)
+        return sock
+
+
+class _GuardedHTTPSConnection(HTTPSConnection):
+    def _new_conn(self):
+        sock = super()._new_conn()
+        _check_peer(sock)
+        return sock
+
+
+class _GuardedHTTPPool(HTTPConnectionPool):
+    ConnectionCls = _GuardedHTTPConnection
+
+
+class _GuardedHTTPSPool(HTTPSConnectionPool):
+    ConnectionCls = _GuardedHTTPSConnection
+
+
+class _GuardedAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _GuardedHTTPPool, "https": _GuardedHTTPSPool}
+
+
+_SESSION = requests.Session()
+_SESSION.trust_env = False  # no env proxies: the peer check must see the real target
+_SESSION.mount("http://", _GuardedAdapter(pool_connections=16, pool_maxsize=32))
+_SESSION.mount("https://", _GuardedAdapter(pool_connections=16, pool_maxsize=32))
+_SESSION.headers["User-Agent"] = "DeepFakeShield/1.0 (+scan-by-url)"
+
+
+class FetchResult:
+    __slots__ = ("url", "status", "data", "content_type", "etag", "last_modified")
+
+    def __init__(self, url, status, data=None, content_type=None, etag=None, last_modified=None):
+        self.url = url
+        self.status = status
+        self.data = data
+        self.content_type = content_type
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status == 304
+
+
+def _check_target(url: str) -> None:
+    """Cheap pre-flight checks; the connect-time peer check is authoritative."""
+    try:
+        parsed = urlparse(url)
+        hostname, _ = parsed.hostname, parsed.port
+    except ValueError:
+        raise FetchError("Malformed URL", 400)
+    if parsed.scheme not in ("http", "https") or not hostname:
+        raise FetchError("Only http(s) URLs are supported")
+    try:
+        literal = ipaddress.ip_address(hostname)
+    except ValueError:
+        return
+    if not _ip_allowed(str(literal)):
+        raise FetchError("URL resolves to a non-public address", 400)
+
+
+def _read_body(r, deadline: float) -> bytes:
+    """
+    Read the body in small pieces, applying the time left before `deadline` to
+    each socket read so a slow-drip server can't hold the worker past it.
+    """
+    sock = getattr(getattr(r.raw, "_connection", None), "sock", None)
+    read = getattr(r.raw, "read1", None) or r.raw.read
+    buf = bytearray()
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise FetchError("Timed out fetching URL", 504)
+        if sock is not None:
+            sock.settimeout(min(READ_TIMEOUT, remaining))
+        try:
+            chunk = read(READ_CHUNK, decode_content=True)
+        except (urllib3.exceptions.ReadTimeoutError, TimeoutError):
+            raise FetchError("Timed out fetching URL", 504)
+        except (urllib3.exceptions.HTTPError, OSError) as e:
+            raise FetchError(f"Could not fetch URL: {e}", 502)
+        if not chunk:
+            return bytes(buf)
+        buf += chunk
+        if len(buf) > MAX_BYTES:
+            raise FetchError("Image too large", 413)
+
+
+def fetch_image(url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> FetchResult:
+    """
+    GET `url` into memory. Sends conditional headers when validators are given
+    and returns a 304 result without a body if the server says nothing changed.
+    Redirects are followed by hand (at most MAX_REDIRECTS), checking each hop.
+    Raises FetchError on bad URLs, non-image content, oversize bodies or timeouts.
+    """
+    headers = {"Accept": ", ".join(sorted(ALLOWED_TYPES))}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    deadline = time.monotonic() + TOTAL_TIMEOUT
+    target = url
+    for _ in range(MAX_REDIRECTS + 1):
+        _check_target(target)
+        try:
+            r = _SESSION.get(target, headers=headers, stream=True,
+                             timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), allow_redirects=False)
+        except requests.Timeout:
+            raise FetchError("Timed out fetching URL", 504)
+        except (requests.exceptions.InvalidURL, requests.exceptions.MissingSchema) as e:
+            raise FetchError(f"Malformed URL: {e}", 400)
+        except requests.RequestException as e:
+            raise FetchError(f"Could not fetch URL: {e}", 502)
+
+        with r:
+            if r.status_code in REDIRECT_CODES and r.headers.get("Location"):
+                try:
+                    target = urljoin(target, r.headers["Location"])
+                except ValueError:
+                    raise FetchError("Upstream sent a malformed redirect", 502)
+                continue
+            if r.status_code == 304:
+                return FetchResult(url, 304, etag=r.headers.get("ETag") or etag,
+                                   last_modified=r.headers.get("Last-Modified") or last_modified)
+            if r.status_code != 200:
+                raise FetchError(f"Upstream returned HTTP {r.status_code}", 502)
+
+            content_type = (r.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+            if content_type not in ALLOWED_TYPES:
+                raise FetchError(f"Unsupported content type: {content_type or 'unknown'}", 415)
+
+            declared = r.headers.get("Content-Length")
+            if declared and declared.isdigit() and int(declared) > MAX_BYTES:
+                raise FetchError("Image too large", 413)
+
+            data = _read_body(r, deadline)
+            return FetchResult(url, 200, data, content_type,
+                               etag=r.headers.get("ETag"), last_modified=r.headers.get("Last-Modified"))
+
+    raise FetchError("Too many redirects", 502)
+
+
+class UrlResultCache:
+    """LRU of scan results per URL, valid for one ETag/Last-Modified pair."""
+
+    def __init__(self, max_entries: int = CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+            return entry
+
+    def lookup(self, url: str, etag: Optional[str], last_modified: Optional[str]) -> Optional[Any]:
+        """Cached result if the URL's validators still match, else None."""
+        entry = self.get(url)
+        if entry is None or not (etag or last_modified):
+            return None
+        if etag and entry["etag"] == etag:
+            return entry["result"]
+        if not etag and last_modified and entry["last_modified"] == last_modified:
+            return entry["result"]
+        return None
+
+    def put(self, url: str, etag: Optional[str], last_modified: Optional[str], result: Any) -> None:
+        if not (etag or last_modified):
+            return  # nothing to revalidate against
+        with self._lock:
+            self._entries[url] = {"etag": etag, "last_modified": last_modified, "result": result}
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SingleFlight:
+    """Run `fn` once per key at a time; concurrent callers get the leader's result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Dict[str, Any]] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]):
+        """Returns (result, shared) where shared is True for coalesced followers."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {"event": threading.Event(), "result": None, "error": None}
+                self._calls[key] = call
+
+        if not leader:
+            call["event"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"], True
+
+        try:
+            call["result"] = fn()
+            return call["result"], False
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call["event"].set()